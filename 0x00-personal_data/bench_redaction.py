@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+'''benchmark suite for the personal data redaction path
+
+every case redacts synthetic messages built from a fixed seed and varies
+the number of fields, message length, separator and share of PII fields;
+filter_datum, RedactingFormatter.format and a get_logger logger are timed
+and results can be saved as JSON to compare runs
+'''
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import time
+import tracemalloc
+from typing import Callable, List
+from filtered_logger import (REDACTION, SEPARATOR, RedactingFormatter,
+                             filter_datum, get_logger)
+
+FIELD_COUNTS = (1, 5, 10, 20)
+LENGTHS = (100, 1000, 10000)
+SEPARATORS = (";", "|")
+DENSITIES = (0.25, 1.0)
+
+
+def make_fields(count: int, density: float) -> List[str]:
+    '''count field names, of which a density share are PII'''
+    pii = max(1, round(count * density))
+    return [f'pii{i}' for i in range(pii)] + \
+        [f'field{i}' for i in range(count - pii)]
+
+
+def make_message(fields: List[str], length: int, separator: str = SEPARATOR,
+                 rng: random.Random = None) -> str:
+    '''build a message of about length chars mentioning every field'''
+    rng = rng or random.Random(0)
+    pairs = [f'{f}=value{rng.randrange(10 ** 6)}{separator}' for f in fields]
+    rng.shuffle(pairs)
+    message = ''.join(pairs)
+    filler = 0
+    while len(message) < length:
+        message += f'extra_{filler}=padding{separator}'
+        filler += 1
+    return message
+
+
+def peak_bytes(func: Callable) -> int:
+    '''bytes allocated at the peak of one call'''
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def timed(func: Callable, lines: int) -> float:
+    '''run func(i) for i in range(lines) and return lines per second'''
+    start = time.perf_counter()
+    for i in range(lines):
+        func(i)
+    return lines / (time.perf_counter() - start)
+
+
+def run_case(field_count: int, length: int, separator: str,
+             density: float, lines: int) -> List[dict]:
+    '''time every target on one synthetic workload'''
+    rng = random.Random(f'{field_count}-{length}-{separator}-{density}')
+    fields = make_fields(field_count, density)
+    pii = [f for f in fields if f.startswith('pii')]
+    messages = [make_message(fields, length, separator, rng)
+                for _ in range(min(lines, 100))]
+    devnull = open(os.devnull, 'w')
+    case = {"fields": field_count, "length": len(messages[0]),
+            "separator": separator, "pii_density": density}
+
+    def redact(i):
+        filter_datum(pii, REDACTION, messages[i % len(messages)], separator)
+
+    targets = [("filter_datum", redact, lambda: redact(0))]
+    if separator == SEPARATOR:
+        formatter = RedactingFormatter(pii)
+        records = [logging.makeLogRecord(
+            {"name": "user_data", "msg": messages[i % len(messages)]})
+            for i in range(lines)]
+        targets.append(("formatter", lambda i: formatter.format(records[i]),
+                        lambda: formatter.format(logging.makeLogRecord(
+                            {"msg": messages[0]}))))
+
+        logging.getLogger("user_data").handlers.clear()
+        logger = get_logger()
+        logger.handlers[0].setFormatter(RedactingFormatter(pii))
+        logger.handlers[0].setStream(devnull)
+        targets.append(("logger",
+                        lambda i: logger.info(messages[i % len(messages)]),
+                        lambda: logger.info(messages[0])))
+
+    results = []
+    for name, func, once in targets:
+        once()
+        results.append(dict(case, target=name,
+                            lines_per_second=round(timed(func, lines)),
+                            peak_bytes_per_line=peak_bytes(once)))
+    devnull.close()
+    return results
+
+
+def main():
+    '''run the suite, print a table and optionally save it as JSON'''
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=5000,
+                        help='lines per measurement')
+    parser.add_argument('--json', help='save results to this file')
+    args = parser.parse_args()
+
+    results = []
+    print(f'{"target":<13}{"fields":>7}{"length":>8}{"sep":>4}'
+          f'{"pii":>6}{"lines/s":>12}{"peak B/line":>13}')
+    for field_count in FIELD_COUNTS:
+        for length in LENGTHS:
+            for separator in SEPARATORS:
+                for density in DENSITIES:
+                    for r in run_case(field_count, length, separator,
+                                      density, args.lines):
+                        results.append(r)
+                        print(f'{r["target"]:<13}{r["fields"]:>7}'
+                              f'{r["length"]:>8}{r["separator"]:>4}'
+                              f'{r["pii_density"]:>6}'
+                              f'{r["lines_per_second"]:>12,}'
+                              f'{r["peak_bytes_per_line"]:>13,}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "time": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       "lines": args.lines, "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
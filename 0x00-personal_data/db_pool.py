@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+'''a small pool of reusable DB-API connections'''
+import threading
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from typing import Callable, Iterator
+
+
+def ping(conn) -> bool:
+    '''check that a connection is still usable'''
+    try:
+        if hasattr(conn, 'ping'):
+            conn.ping(reconnect=False)
+        else:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1;")
+            cursor.fetchall()
+            cursor.close()
+        return True
+    except Exception:
+        return False
+
+
+class ConnectionPool:
+    '''hand out at most size connections made by factory
+
+    idle connections are reused most-recently-returned first and are
+    checked with validate on checkout; dead ones are replaced.
+    Connections are rolled back when released
+    '''
+
+    def __init__(self, factory: Callable, size: int = 5,
+                 validate: Callable = ping, timeout: float = None):
+        '''init'''
+        self.factory = factory
+        self.size = max(1, size)
+        self.validate = validate
+        self.timeout = timeout
+        self._idle = LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "reused": 0, "discarded": 0,
+                       "waits": 0, "in_use": 0}
+
+    def _count(self, name: str, step: int = 1):
+        '''update a statistic'''
+        with self._lock:
+            self._stats[name] += step
+
+    def acquire(self):
+        '''check a connection out, waiting for a free slot if needed'''
+        if not self._slots.acquire(blocking=False):
+            self._count("waits")
+            if not self._slots.acquire(timeout=self.timeout):
+                raise TimeoutError('no database connection available')
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except Empty:
+                    break
+                if self.validate is None or self.validate(conn):
+                    self._count("reused")
+                    self._count("in_use")
+                    return conn
+                self._count("discarded")
+                self._close(conn)
+            conn = self.factory()
+        except BaseException:
+            self._slots.release()
+            raise
+        self._count("created")
+        self._count("in_use")
+        return conn
+
+    def release(self, conn):
+        '''return a connection to the pool
+
+        its transaction is rolled back so the next borrower does not
+        inherit it (and its snapshot); connections that fail to roll
+        back are discarded
+        '''
+        try:
+            conn.rollback()
+        except Exception:
+            self._count("discarded")
+            self._close(conn)
+        else:
+            self._idle.put(conn)
+        self._count("in_use", -1)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self) -> Iterator:
+        '''checkout for the duration of a with block'''
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self) -> dict:
+        '''pool statistics'''
+        with self._lock:
+            stats = dict(self._stats)
+        stats["idle"] = self._idle.qsize()
+        stats["size"] = self.size
+        return stats
+
+    @staticmethod
+    def _close(conn):
+        '''close a connection, ignoring errors'''
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        '''close every idle connection'''
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except Empty:
+                return
@@ -1,19 +1,115 @@
 #!/usr/bin/env python3
 '''Using Bcript for password encryptions'''
+import asyncio
+import math
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
 import bcrypt
 
+POOL_SIZE = int(os.environ.get("BCRYPT_POOL_SIZE", os.cpu_count() or 1))
+TARGET_MS = float(os.environ.get("BCRYPT_TARGET_MS", 250))
+# the bcrypt.gensalt() default: calibration only ever raises the cost
+MIN_ROUNDS = 12
+MAX_ROUNDS = 31
+PROBE_ROUNDS = 8
+
+_executor = None
+_rounds = None
+
+
+def calibrate_rounds(target_ms: float = TARGET_MS) -> int:
+    '''the highest bcrypt cost hashing within target_ms on this machine
+
+    a cheap cost is timed and extrapolated, every extra round doubling
+    the work; the result is kept between MIN_ROUNDS and MAX_ROUNDS
+    '''
+    salt = bcrypt.gensalt(PROBE_ROUNDS)
+    elapsed = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        bcrypt.hashpw(b'calibration', salt)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    rounds = PROBE_ROUNDS + math.floor(math.log2(target_ms / 1000 / elapsed))
+    return max(MIN_ROUNDS, min(MAX_ROUNDS, rounds))
+
+
+def get_rounds() -> int:
+    '''BCRYPT_ROUNDS, or the cost calibrated once for this process'''
+    global _rounds
+    if _rounds is None:
+        rounds = os.environ.get("BCRYPT_ROUNDS")
+        _rounds = int(rounds) if rounds else calibrate_rounds()
+    return _rounds
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    '''the cost a bcrypt hash was made with'''
+    return int(hashed_password.split(b'$')[2])
+
+
+def needs_rehash(hashed_password: bytes) -> bool:
+    '''whether a hash was made with less than the current cost'''
+    return hash_rounds(hashed_password) < get_rounds()
+
 
 def hash_password(password: str) -> bytes:
     '''hashes a password'''
     encoded_password = password.encode()
-    hashed_password = bcrypt.hashpw(encoded_password, bcrypt.gensalt())
+    hashed_password = bcrypt.hashpw(encoded_password,
+                                    bcrypt.gensalt(get_rounds()))
     return hashed_password
 
 
-def is_valid(hashed_password: bytes, password: str) -> bool:
-    '''checks if password and the hashed password corresponds'''
+def is_valid(hashed_password: bytes, password: str,
+             rehash: Callable[[bytes], None] = None) -> bool:
+    '''checks if password and the hashed password corresponds
+
+    when the password is valid but its hash has an outdated cost, rehash
+    is called with a new hash so the caller can store it
+    '''
     iss_valid = False
     encoded_password = password.encode()
     if bcrypt.checkpw(encoded_password, hashed_password):
         iss_valid = True
+        if rehash is not None and needs_rehash(hashed_password):
+            rehash(hash_password(password))
     return iss_valid
+
+
+def get_executor() -> ThreadPoolExecutor:
+    '''the shared pool running bcrypt off the calling thread
+
+    bcrypt releases the GIL, so up to POOL_SIZE (BCRYPT_POOL_SIZE)
+    hashes run on separate cores at once
+    '''
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=POOL_SIZE,
+                                       thread_name_prefix="bcrypt")
+    return _executor
+
+
+def hash_password_async(password: str) -> Future:
+    '''hash_password on the bcrypt pool'''
+    return get_executor().submit(hash_password, password)
+
+
+def is_valid_async(hashed_password: bytes, password: str,
+                   rehash: Callable[[bytes], None] = None) -> Future:
+    '''is_valid on the bcrypt pool'''
+    return get_executor().submit(is_valid, hashed_password, password,
+                                 rehash)
+
+
+async def hash_password_aio(password: str) -> bytes:
+    '''awaitable hash_password'''
+    return await asyncio.wrap_future(hash_password_async(password))
+
+
+async def is_valid_aio(hashed_password: bytes, password: str,
+                       rehash: Callable[[bytes], None] = None) -> bool:
+    '''awaitable is_valid'''
+    return await asyncio.wrap_future(
+        is_valid_async(hashed_password, password, rehash))
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+'''parallel, sharded export of the redacted users table'''
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, List, Tuple
+from filtered_logger import (PII_FIELDS, BATCH_SIZE, PRE_REDACTED_FIELD,
+                             RedactingFormatter, RowRedactor, get_db,
+                             get_logger, stream_rows)
+
+CHECKPOINT_FILE = ".users_export.checkpoint"
+
+
+def key_ranges(low: int, high: int, shards: int) -> List[Tuple[int, int]]:
+    '''split [low, high] into at most shards half-open ranges'''
+    span = high - low + 1
+    shards = max(1, min(shards, span))
+    step = -(-span // shards)
+    return [(start, min(start + step, high + 1))
+            for start in range(low, high + 1, step)]
+
+
+def export_shard(connect: Callable, key: str, start: int, end: int,
+                 path: str, batch_size: int = BATCH_SIZE) -> int:
+    '''redact the rows with start <= key < end into path'''
+    formatter = RedactingFormatter(list(PII_FIELDS))
+    db = connect()
+    count = 0
+    try:
+        cursor = db.cursor()
+        cursor.execute(f"SELECT * FROM users WHERE {key} >= {int(start)} "
+                       f"AND {key} < {int(end)} ORDER BY {key};")
+        redact_row = RowRedactor([i[0] for i in cursor.description])
+        with open(path, 'w') as f:
+            for rows in stream_rows(cursor, batch_size):
+                lines = [formatter.format(logging.makeLogRecord({
+                    'name': 'user_data', 'levelno': logging.INFO,
+                    'levelname': 'INFO', 'msg': redact_row(row),
+                    PRE_REDACTED_FIELD: True
+                })) for row in rows]
+                f.write('\n'.join(lines) + '\n')
+                count += len(rows)
+        cursor.close()
+    finally:
+        db.close()
+    return count
+
+
+def export(connect: Callable = get_db, key: str = "id", shards: int = None,
+           workers: int = None, out_dir: str = ".", output: str = None,
+           batch_size: int = BATCH_SIZE) -> int:
+    '''export the users table in parallel, one shard per key range
+
+    connect must be picklable (get_db, or a partial around a DB-API
+    connect) since every worker opens its own connection. Shard files
+    are named users.<n>.log in out_dir; when output is given they are
+    concatenated into it in key order and removed.
+    '''
+    if not re.fullmatch(r'\w+', key):
+        raise ValueError(f'invalid key column: {key}')
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers
+
+    db = connect()
+    try:
+        cursor = db.cursor()
+        cursor.execute(f"SELECT MIN({key}), MAX({key}) FROM users;")
+        low, high = cursor.fetchone()
+        cursor.close()
+    finally:
+        db.close()
+    if low is None:
+        return 0
+
+    paths = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for n, (start, end) in enumerate(key_ranges(int(low), int(high),
+                                                    shards)):
+            path = os.path.join(out_dir, f'users.{n}.log')
+            paths.append(path)
+            futures.append(pool.submit(export_shard, connect, key,
+                                       start, end, path, batch_size))
+        total = sum(future.result() for future in futures)
+
+    if output is not None:
+        with open(output, 'w') as out:
+            for path in paths:
+                with open(path) as f:
+                    shutil.copyfileobj(f, out)
+                os.remove(path)
+    return total
+
+
+def placeholder(db) -> str:
+    '''the parameter marker of the DB-API module db comes from'''
+    module = type(db).__module__
+    while module:
+        paramstyle = getattr(sys.modules.get(module), 'paramstyle', None)
+        if paramstyle is not None:
+            return '?' if paramstyle == 'qmark' else '%s'
+        module = module.rpartition('.')[0]
+    return '%s'
+
+
+def read_checkpoint(path: str, column: str) -> Any:
+    '''the high-water mark saved for column, None when there is none'''
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get('column') != column:
+        return None
+    return checkpoint.get('value')
+
+
+def write_checkpoint(path: str, column: str, value: Any):
+    '''atomically replace the checkpoint file'''
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'column': column, 'value': value}, f, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def export_incremental(connect: Callable = get_db,
+                       column: str = "last_login",
+                       checkpoint: str = CHECKPOINT_FILE,
+                       batch_size: int = BATCH_SIZE) -> int:
+    '''log only the rows at or past the saved high-water mark of column
+
+    the mark is saved after every batch, so a crashed run resumes from
+    its last full batch; rows equal to the mark are read again, which
+    makes the export at-least-once when column values are not unique
+    '''
+    if not re.fullmatch(r'\w+', column):
+        raise ValueError(f'invalid column: {column}')
+    since = read_checkpoint(checkpoint, column)
+    logger = get_logger()
+    pre_redacted = {PRE_REDACTED_FIELD: True}
+    count = 0
+    db = connect()
+    try:
+        cursor = db.cursor()
+        if since is None:
+            cursor.execute(f"SELECT * FROM users ORDER BY {column};")
+        else:
+            cursor.execute(f"SELECT * FROM users WHERE {column} >= "
+                           f"{placeholder(db)} ORDER BY {column};", (since,))
+        field_names = [i[0] for i in cursor.description]
+        redact_row = RowRedactor(field_names)
+        position = field_names.index(column)
+        for rows in stream_rows(cursor, batch_size):
+            for row in rows:
+                logger.info(redact_row(row), extra=pre_redacted)
+            count += len(rows)
+            if rows[-1][position] is not None:
+                write_checkpoint(checkpoint, column, rows[-1][position])
+        cursor.close()
+    finally:
+        db.close()
+    return count
+
+
+def main():
+    '''command line entry point'''
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--key', default='id',
+                        help='integer primary key column to shard on')
+    parser.add_argument('--shards', type=int)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--out-dir', default='.')
+    parser.add_argument('--output',
+                        help='merge the shards into this file, in order')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--sqlite',
+                        help='read from this SQLite file instead of MySQL')
+    parser.add_argument('--incremental', metavar='COLUMN',
+                        help='only log rows past the checkpoint of COLUMN')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE)
+    args = parser.parse_args()
+
+    connect = partial(sqlite3.connect, args.sqlite) if args.sqlite \
+        else get_db
+    if args.incremental:
+        total = export_incremental(connect, args.incremental,
+                                   args.checkpoint, args.batch_size)
+    else:
+        total = export(connect, args.key, args.shards, args.workers,
+                       args.out_dir, args.output, args.batch_size)
+    print(f'{total} rows exported')
+
+
+if __name__ == '__main__':
+    main()
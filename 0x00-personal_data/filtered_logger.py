@@ -1,40 +1,111 @@
 #!/usr/bin/env python3
 '''perdonla data source'''
 import logging
-from typing import List
+from functools import lru_cache, partial
+from typing import Callable, Iterator, List, Sequence, Tuple
 from os import environ
 import mysql.connector
 import re
+from collections.abc import Mapping
+from db_pool import ConnectionPool
+from log_throttle import DedupFilter, TokenBucketFilter
+from queued_logging import BoundedQueueHandler, queued_handler
 
 PII_FIELDS = ("name", "email", "phone", "ssn", "password")
 
 REDACTION = "***"
 FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
 SEPARATOR = ";"
+BATCH_SIZE = 1000
+POOL_SIZE = 5
+STRUCTURED_FIELD = "data"
+PRE_REDACTED_FIELD = "pre_redacted"
+REDACTION_CACHE_FIELD = "_redaction_cache"
+
+_db_pool = None
+
+
+@lru_cache(maxsize=128)
+def get_redactor(fields: Tuple[str, ...], redaction: str,
+                 separator: str) -> Callable[[str], str]:
+    '''compile the fields into one pattern and return a redacting callable
+
+    every field is matched by a single alternation, so a message is
+    scanned once whatever the number of fields, and the compiled pattern
+    is cached per (fields, redaction, separator)
+    '''
+    if not fields:
+        return lambda message: message
+    sep = re.escape(separator)
+    alternation = '|'.join(re.escape(f) for f in fields)
+    pattern = re.compile(f'({alternation})=.*?{sep}')
+    replacement = r'\g<1>=' + (redaction + separator).replace('\\', r'\\')
+    return partial(pattern.sub, replacement)
 
 
 def filter_datum(fields: List[str], redaction: str,
                  message: str, separator: str) -> str:
     '''regex pattern'''
-    for f in fields:
-        message = re.sub(f'{f}=.*?{separator}',
-                         f'{f}={redaction}{separator}', message)
-    return message
+    return get_redactor(tuple(fields), redaction, separator)(message)
 
 
-def get_logger() -> logging.Logger:
-    '''return logger information'''
+def get_logger(queued: bool = False, queue_size: int = 10000,
+               overflow: str = "block", batch_size: int = 100,
+               dedup_window: float = None, rate: float = None,
+               burst: int = None) -> logging.Logger:
+    '''return logger information
+
+    with queued set, records go to a bounded queue and a listener thread
+    redacts and writes them in batches (see queued_logging); dedup_window
+    and rate add the log_throttle filters, which drop records before any
+    handler redacts them
+
+    the logger is configured once: later calls reuse its handler and
+    filters (updating the filter settings), and only replace the
+    handler when switching between queued and direct output
+    '''
     logg_er = logging.getLogger("user_data")
     logg_er.setLevel(logging.INFO)
     logg_er.propagate = False
+    if dedup_window is not None:
+        dedup = _find(logg_er.filters, DedupFilter)
+        if dedup is None:
+            logg_er.addFilter(DedupFilter(dedup_window))
+        else:
+            dedup.window = dedup.interval = dedup_window
+    if rate is not None:
+        bucket = _find(logg_er.filters, TokenBucketFilter)
+        if bucket is None:
+            logg_er.addFilter(TokenBucketFilter(rate, burst))
+        else:
+            bucket.rate, bucket.interval = rate, max(1.0, 1 / rate)
+            bucket.burst = burst if burst is not None else max(1, int(rate))
 
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(RedactingFormatter(list(PII_FIELDS)))
-    logg_er.addHandler(stream_handler)
+    kind = BoundedQueueHandler if queued else logging.StreamHandler
+    if _find(logg_er.handlers, kind) is not None:
+        return logg_er
+    for handler in list(logg_er.handlers):
+        logg_er.removeHandler(handler)
+        if isinstance(handler, BoundedQueueHandler):
+            handler.listener.stop()
+        else:
+            handler.close()
+    formatter = RedactingFormatter(list(PII_FIELDS))
+    if queued:
+        handler = queued_handler(formatter, queue_size, overflow, batch_size)
+    else:
+        handler = logging.StreamHandler()
+        handler.setFormatter(formatter)
+    logg_er.addHandler(handler)
 
     return logg_er
 
 
+def _find(items: list, kind: type):
+    '''first item of items that is an instance of kind, or None'''
+    return next((item for item in items if isinstance(item, kind)), None)
+
+
 def get_db() -> mysql.connector.connection.MySQLConnection:
     '''connect to mydal database'''
     username = environ.get("PERSONAL_DATA_DB_USERNAME", "root")
@@ -49,6 +120,22 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     return conn
 
 
+def get_db_pool(factory: Callable = None) -> ConnectionPool:
+    '''return the shared connection pool, creating it on first use
+
+    connections come from factory (get_db by default) and the pool holds
+    PERSONAL_DATA_DB_POOL_SIZE of them; a factory can only be given
+    before the pool exists, ValueError is raised for a different one
+    '''
+    global _db_pool
+    if _db_pool is None:
+        size = int(environ.get("PERSONAL_DATA_DB_POOL_SIZE", POOL_SIZE))
+        _db_pool = ConnectionPool(factory or get_db, size)
+    elif factory is not None and factory is not _db_pool.factory:
+        raise ValueError('the database pool already uses another factory')
+    return _db_pool
+
+
 class RedactingFormatter(logging.Formatter):
     '''redacting '''
 
@@ -56,31 +143,133 @@ class RedactingFormatter(logging.Formatter):
         '''init'''
         super(RedactingFormatter, self).__init__(FORMAT)
         self.fields = fields
+        self.redact = get_redactor(tuple(fields), REDACTION, SEPARATOR)
+        self.pii = frozenset(fields)
+
+    def mask(self, data: Mapping) -> dict:
+        '''copy data with the PII keys replaced by REDACTION'''
+        pii = self.pii
+        return {k: REDACTION if k in pii else v for k, v in data.items()}
+
+    def _redact_record(self, record: logging.LogRecord) -> str:
+        '''redact structured records by key and plain ones by regex
+
+        a mapping passed as the logging args, or under extra={"data": ...},
+        is masked by key lookup and never rendered to text before that;
+        the rest of the message goes through the regex as usual, and
+        records logged with extra={"pre_redacted": True} are trusted as is
+        '''
+        if getattr(record, PRE_REDACTED_FIELD, False):
+            return record.getMessage()
+        data = getattr(record, STRUCTURED_FIELD, None)
+        if isinstance(record.args, Mapping):
+            message = str(record.msg) % self.mask(record.args)
+        else:
+            message = self.redact(record.getMessage())
+        if isinstance(data, Mapping):
+            masked = self.mask(data)
+            rendered = format_row(masked.values(), masked.keys())
+            message = f'{message} {rendered}' if message else rendered
+        return message
+
+    def redacted_message(self, record: logging.LogRecord) -> str:
+        '''redact the record message at most once per record
+
+        the result is cached on the record, keyed by the shared redactor,
+        so every handler formatting the same record reuses it; the cache
+        lives under a private attribute and is replaced if something else
+        set that attribute
+        '''
+        cache = record.__dict__.get(REDACTION_CACHE_FIELD)
+        if not isinstance(cache, dict):
+            cache = record.__dict__[REDACTION_CACHE_FIELD] = {}
+        message = cache.get(self.redact)
+        if message is None:
+            message = cache[self.redact] = self._redact_record(record)
+        return message
 
     def format(self, record: logging.LogRecord) -> str:
-        '''formating'''
-        record.msg = filter_datum(self.fields, REDACTION,
-                                  record.getMessage(), SEPARATOR)
-        return super(RedactingFormatter, self).format(record)
+        '''formating, without touching record.msg'''
+        record.message = self.redacted_message(record)
+        if self.usesTime():
+            record.asctime = self.formatTime(record, self.datefmt)
+        s = self.formatMessage(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            s = s.rstrip('\n') + '\n' + record.exc_text
+        if record.stack_info:
+            s = s.rstrip('\n') + '\n' + self.formatStack(record.stack_info)
+        return s
+
+
+def stream_rows(cursor, batch_size: int) -> Iterator[List[tuple]]:
+    '''yield fetchmany batches until the cursor is exhausted'''
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def format_row(row: Sequence, field_names: Sequence[str]) -> str:
+    '''render a row as field=value; pairs'''
+    str_row = ''.join(
+        f'{f}={str(r)}; ' for r, f in zip(
+            row, field_names))
+    return str_row.strip()
+
 
+class RowRedactor:
+    '''mask PII columns of query rows by position
 
-def main():
-    '''the main program'''
+    the PII column indexes are resolved once from the column names, so
+    each row is masked without rendering and regex scanning it; the
+    output matches filter_datum applied to format_row
+    '''
+
+    def __init__(self, field_names: Sequence[str],
+                 fields: Sequence[str] = PII_FIELDS):
+        '''init'''
+        self.field_names = list(field_names)
+        pii = frozenset(fields)
+        self.indexes = [i for i, name in enumerate(self.field_names)
+                        if name in pii]
+
+    def __call__(self, row: Sequence) -> str:
+        '''render row with its PII columns masked'''
+        values = list(row)
+        for i in self.indexes:
+            values[i] = REDACTION
+        return format_row(values, self.field_names)
+
+
+def main(batch_size: int = None):
+    '''the main program
+
+    rows are read from an unbuffered cursor batch_size at a time
+    (PERSONAL_DATA_BATCH_SIZE by default), so memory does not grow
+    with the size of the users table; each batch is logged as one
+    record holding one line per row
+    '''
+    if batch_size is None:
+        batch_size = int(environ.get("PERSONAL_DATA_BATCH_SIZE", BATCH_SIZE))
+    logger = get_logger()
+    if not logger.isEnabledFor(logging.INFO):
+        return
     db = None  # Initialize db to None
     cursor = None  # Initialize cursor to None
     try:
         db = get_db()
-        cursor = db.cursor()
+        cursor = db.cursor(buffered=False)
         cursor.execute("SELECT * FROM users;")
         field_names = [i[0] for i in cursor.description]
+        redact_row = RowRedactor(field_names)
+        pre_redacted = {PRE_REDACTED_FIELD: True}
 
-        logger = get_logger()
-
-        for row in cursor:
-            str_row = ''.join(
-                f'{f}={str(r)}; ' for r, f in zip(
-                    row, field_names))
-            logger.info(str_row.strip())
+        for rows in stream_rows(cursor, batch_size):
+            logger.info("\n".join(redact_row(row) for row in rows),
+                        extra=pre_redacted)
 
     except mysql.connector.Error as err:
         logging.error(f'Error connecting to database: {err}')
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+'''filters that keep logging cheap when the same lines flood in'''
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+
+SUMMARY_FIELD = "throttle_summary"
+
+
+def annotate(record: logging.LogRecord, note: str):
+    '''append a note to the record message template'''
+    record.msg = f'{record.msg} [{note}]'
+
+
+def summary(record: logging.LogRecord, note: str) -> logging.LogRecord:
+    '''copy of a dropped record annotated with note, let through by
+    the throttling filters'''
+    copy = logging.makeLogRecord(record.__dict__)
+    annotate(copy, note)
+    copy.__dict__[SUMMARY_FIELD] = True
+    return copy
+
+
+class SummaryFilter(logging.Filter):
+    '''base of the filters that drop records and later log a summary
+
+    summaries are due once their window closes; they are logged, through
+    the logger of the dropped record, when the next record is filtered
+    or from a background thread started with the first drop, and on
+    close() or at exit
+    '''
+
+    def __init__(self, interval: float):
+        '''init'''
+        super(SummaryFilter, self).__init__()
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None
+
+    def _due(self, now: float, force: bool) -> List[logging.LogRecord]:
+        '''pop the summaries due at now, or all of them with force;
+        called with the lock held'''
+        raise NotImplementedError
+
+    def _start(self):
+        '''start the background flusher; called with the lock held'''
+        if self._flusher is None and not self._stop.is_set():
+            self._flusher = threading.Thread(target=self._flush_loop,
+                                             daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+
+    def _flush_loop(self):
+        '''flush every interval seconds until closed'''
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self, now: float = None, force: bool = False):
+        '''log the summaries due at now (the current time by default)'''
+        with self._lock:
+            summaries = self._due(time.time() if now is None else now, force)
+        for record in summaries:
+            logging.getLogger(record.name).handle(record)
+
+    def close(self):
+        '''stop the background flusher and log every pending summary'''
+        self._stop.set()
+        self.flush(force=True)
+
+
+class DedupFilter(SummaryFilter):
+    '''collapse repeats of a message within window seconds
+
+    the first record of a window passes, the repeats are counted and
+    dropped, and once the window closes a copy of the last repeat is
+    logged with the count; records are keyed by level and unformatted
+    message, so lines only differing by their arguments count as repeats
+    '''
+
+    def __init__(self, window: float = 1.0, max_keys: int = 10000):
+        '''init'''
+        super(DedupFilter, self).__init__(window)
+        self.window = window
+        self.max_keys = max_keys
+        # key -> [window start, repeats, last repeat], oldest window first
+        self._seen = OrderedDict()
+
+    def _due(self, now: float, force: bool) -> List[logging.LogRecord]:
+        '''pop the closed windows, oldest first'''
+        summaries = []
+        seen = self._seen
+        while seen:
+            start, repeats, last = next(iter(seen.values()))
+            if not force and now - start < self.window and \
+                    len(seen) <= self.max_keys:
+                break
+            seen.popitem(last=False)
+            if repeats:
+                summaries.append(
+                    summary(last, f'repeated {repeats} more times'))
+        return summaries
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        '''pass the first record of each window'''
+        if getattr(record, SUMMARY_FIELD, False):
+            return True
+        self.flush(record.created)
+        key = (record.levelno, str(record.msg))
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None:
+                entry[1] += 1
+                entry[2] = record
+                self._start()
+                return False
+            self._seen[key] = [record.created, 0, None]
+        return True
+
+
+class TokenBucketFilter(SummaryFilter):
+    '''let at most rate records per second through, per logger and level
+
+    bursts of up to burst records pass at once; once a bucket has a
+    token again after dropping records, a copy of the last dropped
+    record is logged with the number dropped
+    '''
+
+    def __init__(self, rate: float = 100.0, burst: int = None):
+        '''init'''
+        super(TokenBucketFilter, self).__init__(max(1.0, 1 / rate))
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self.dropped = 0
+        # key -> [tokens, updated, dropped, last dropped record]
+        self._buckets = {}
+
+    def _due(self, now: float, force: bool) -> List[logging.LogRecord]:
+        '''pop the drop counts of the buckets holding a token again'''
+        summaries = []
+        for bucket in self._buckets.values():
+            if not bucket[2]:
+                continue
+            if not force and \
+                    bucket[0] + (now - bucket[1]) * self.rate < 1:
+                continue
+            summaries.append(summary(
+                bucket[3], f'{bucket[2]} records dropped by rate limit'))
+            bucket[2], bucket[3] = 0, None
+        return summaries
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        '''spend a token or drop the record'''
+        if getattr(record, SUMMARY_FIELD, False):
+            return True
+        self.flush(record.created)
+        key = (record.name, record.levelno)
+        now = record.created
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now, 0,
+                                               None]
+            tokens = min(self.burst,
+                         bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                bucket[3] = record
+                self.dropped += 1
+                self._start()
+                return False
+            bucket[0] = tokens - 1
+        return True
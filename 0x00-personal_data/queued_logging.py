@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+'''bounded queue logging: callers enqueue, a listener thread formats'''
+import atexit
+import logging
+import queue
+import sys
+import threading
+import traceback
+from collections.abc import Mapping
+from logging.handlers import QueueHandler
+from typing import IO, List
+
+OVERFLOW_POLICIES = ("block", "drop", "sample")
+
+
+class BoundedQueueHandler(QueueHandler):
+    '''enqueue records without formatting them on the calling thread
+
+    overflow decides what happens when the queue is full:
+    block waits for room, drop discards the record and sample keeps one
+    record out of every sample_rate overflowing ones (waiting for it)
+    '''
+
+    def __init__(self, record_queue: queue.Queue, overflow: str = "block",
+                 sample_rate: int = 10):
+        '''init'''
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'unknown overflow policy: {overflow}')
+        super(BoundedQueueHandler, self).__init__(record_queue)
+        self.overflow = overflow
+        self.sample_rate = max(1, sample_rate)
+        self.dropped = 0
+        self._overflowed = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        '''merge the arguments only, redaction is left to the listener
+
+        mapping arguments are structured data the formatter masks by key,
+        so they are passed through unmerged
+        '''
+        if isinstance(record.args, Mapping):
+            return record
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        '''put the record on the queue following the overflow policy'''
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            self._overflowed += 1
+        if self.overflow == "sample" and \
+                self._overflowed % self.sample_rate == 0:
+            self.queue.put(record)
+        else:
+            self.dropped += 1
+
+
+class BatchingListener:
+    '''drain a record queue on a thread, writing formatted batches'''
+
+    _sentinel = None
+
+    def __init__(self, record_queue: queue.Queue, formatter: logging.Formatter,
+                 stream: IO[str] = None, batch_size: int = 100):
+        '''init'''
+        self.queue = record_queue
+        self.formatter = formatter
+        self.stream = stream if stream is not None else sys.stderr
+        self.batch_size = max(1, batch_size)
+        self._thread = None
+
+    def start(self):
+        '''start the background thread'''
+        self._thread = threading.Thread(target=self._monitor, daemon=True,
+                                        name="user_data-log-listener")
+        self._thread.start()
+
+    def stop(self):
+        '''write everything still queued and stop the thread'''
+        if self._thread is None:
+            return
+        self.queue.put(self._sentinel)
+        self._thread.join()
+        self._thread = None
+
+    def _write(self, batch: List[logging.LogRecord]):
+        '''format and write a batch with a single write call'''
+        if not batch:
+            return
+        try:
+            lines = [self.formatter.format(record) for record in batch]
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+        except Exception:
+            if logging.raiseExceptions:
+                traceback.print_exc(file=sys.stderr)
+
+    def _monitor(self):
+        '''block for one record, then take whatever else is ready'''
+        while True:
+            record = self.queue.get()
+            batch = []
+            stop = record is self._sentinel
+            if not stop:
+                batch.append(record)
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is self._sentinel:
+                    stop = True
+                else:
+                    batch.append(record)
+            self._write(batch)
+            if stop:
+                return
+
+
+def queued_handler(formatter: logging.Formatter, queue_size: int = 10000,
+                   overflow: str = "block", batch_size: int = 100,
+                   stream: IO[str] = None) -> BoundedQueueHandler:
+    '''build a started queue handler whose listener stops at exit'''
+    record_queue = queue.Queue(maxsize=queue_size)
+    handler = BoundedQueueHandler(record_queue, overflow)
+    handler.listener = BatchingListener(record_queue, formatter,
+                                        stream, batch_size)
+    handler.listener.start()
+    atexit.register(handler.listener.stop)
+    return handler
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+'''redact existing log files in parallel with filter_datum semantics'''
+import argparse
+import mmap
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+from filtered_logger import PII_FIELDS, REDACTION, SEPARATOR, filter_datum
+
+CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def chunk_bounds(mm: mmap.mmap,
+                 chunk_size: int) -> Iterator[Tuple[int, int]]:
+    '''yield (start, end) offsets of about chunk_size, ending on newlines'''
+    size = len(mm)
+    start = 0
+    while start < size:
+        end = start + chunk_size
+        if end >= size:
+            end = size
+        else:
+            newline = mm.find(b'\n', end - 1)
+            end = size if newline == -1 else newline + 1
+        yield start, end
+        start = end
+
+
+def redact_chunk(path: str, start: int, end: int, fields: List[str],
+                 redaction: str, separator: str) -> bytes:
+    '''redact the bytes [start, end) of path'''
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode('utf-8', 'surrogateescape')
+    return filter_datum(fields, redaction, text,
+                        separator).encode('utf-8', 'surrogateescape')
+
+
+def redact_file(path: str, output: str, pool: ProcessPoolExecutor,
+                fields: List[str] = list(PII_FIELDS),
+                redaction: str = REDACTION, separator: str = SEPARATOR,
+                chunk_size: int = CHUNK_SIZE, in_flight: int = None):
+    '''redact path into output, chunks in order, few chunks in memory
+
+    at most in_flight chunks (twice the CPU count by default) are being
+    redacted or waiting to be written at any time; the output is written
+    to a temporary file renamed into place at the end, so output may be
+    path itself and a failed run leaves no partial output
+    '''
+    in_flight = in_flight or 2 * (os.cpu_count() or 1)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(output)),
+        prefix=os.path.basename(output) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            if os.path.getsize(path) > 0:
+                _redact_into(out, path, pool, fields, redaction, separator,
+                             chunk_size, in_flight)
+        os.replace(tmp_path, output)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _redact_into(out, path: str, pool: ProcessPoolExecutor,
+                 fields: List[str], redaction: str, separator: str,
+                 chunk_size: int, in_flight: int):
+    '''write the redacted chunks of path to out, in order'''
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pending = deque()
+        for start, end in chunk_bounds(mm, chunk_size):
+            if len(pending) >= in_flight:
+                out.write(pending.popleft().result())
+            pending.append(pool.submit(redact_chunk, path, start, end,
+                                       fields, redaction, separator))
+        while pending:
+            out.write(pending.popleft().result())
+
+
+def main():
+    '''command line entry point'''
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('paths', nargs='+', metavar='LOG')
+    parser.add_argument('--out-dir',
+                        help='write here instead of next to each input')
+    parser.add_argument('--suffix', default='.redacted')
+    parser.add_argument('--fields', nargs='+', default=list(PII_FIELDS))
+    parser.add_argument('--separator', default=SEPARATOR)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='bytes per chunk')
+    args = parser.parse_args()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for path in args.paths:
+            directory = args.out_dir or os.path.dirname(path)
+            output = os.path.join(directory,
+                                  os.path.basename(path) + args.suffix)
+            redact_file(path, output, pool, args.fields, REDACTION,
+                        args.separator, args.chunk_size)
+            print(f'{path} -> {output}')
+
+
+if __name__ == '__main__':
+    main()
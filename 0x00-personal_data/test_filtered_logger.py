@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+'''tests for the structured records of RedactingFormatter'''
+import logging
+import unittest
+from filtered_logger import PII_FIELDS, RedactingFormatter
+
+
+def make_record(msg: str, *args, **extra) -> logging.LogRecord:
+    '''build a record the way Logger.info(msg, *args, extra=extra) does'''
+    record = logging.LogRecord("user_data", logging.INFO, __file__, 0,
+                               msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestStructuredRecords(unittest.TestCase):
+    '''extra={"data": ...} records'''
+
+    def setUp(self):
+        '''formatter over the PII fields'''
+        self.formatter = RedactingFormatter(list(PII_FIELDS))
+
+    def test_message_text_is_redacted(self):
+        '''PII in the message text is still redacted'''
+        record = make_record("email=bob@x.com;", data={"ssn": "123"})
+        message = self.formatter.redacted_message(record)
+        self.assertEqual(message, "email=***; ssn=***;")
+
+    def test_positional_args_are_merged(self):
+        '''positional args are merged into the message'''
+        record = make_record("user %s logged in", 42,
+                             data={"name": "bob", "role": "admin"})
+        message = self.formatter.redacted_message(record)
+        self.assertEqual(message, "user 42 logged in name=***; role=admin;")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+""" Measure the memory held per resident User
+
+Users are built the way load_from_file builds them, from JSON
+dictionaries with fresh strings, and kept in DATA and the indexes.
+The storage mode is read at import, so compare the two modes with:
+
+    $ python3 bench_models.py
+    $ MODELS_COMPACT=1 python3 bench_models.py
+"""
+import argparse
+import hashlib
+import random
+import time
+import tracemalloc
+from models.base import COMPACT, DATA
+from models.user import User
+
+
+def user_json(i: int, rng: random.Random, names: int) -> dict:
+    """ JSON dictionary of the i-th synthetic user
+    """
+    return {
+        'id': "{:08x}-0000-4000-8000-{:012x}".format(i, i),
+        'created_at': "2024-01-01T00:{:02d}:{:02d}".format(i // 60 % 60,
+                                                           i % 60),
+        'updated_at': "2024-06-01T12:00:{:02d}".format(i % 60),
+        'email': "user{}@example.com".format(i),
+        '_password': hashlib.sha256(str(i).encode()).hexdigest(),
+        'first_name': "First{}".format(rng.randrange(names)),
+        'last_name': "Last{}".format(rng.randrange(names)),
+    }
+
+
+def main():
+    """ Build the users and print the bytes held per user
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--users', type=int, default=1000000,
+                        help='number of users')
+    parser.add_argument('--names', type=int, default=1000,
+                        help='distinct first and last names')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    User.load_from_file()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(args.users):
+        user = User(**user_json(i, rng, args.names))
+        DATA['User'][user.id] = user
+        User._index(user)
+    elapsed = time.perf_counter() - start
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("mode: {}  users: {}  bytes/user: {:.0f}  build: {:.1f} s".format(
+        "compact" if COMPACT else "dict", args.users,
+        held / args.users, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+""" Move the objects of the .db_<Class>.json files into SQLite
+
+With MODELS_STORAGE=sqlite the JSON files are not read anymore, so
+run this once, from the directory holding them, before switching:
+
+    $ MODELS_STORAGE=sqlite python3 migrate_to_sqlite.py
+
+Each file is imported at most once; running it again changes nothing.
+"""
+import argparse
+from models.base import SQLITE
+from models.user import User
+
+CLASSES = [User]
+
+
+def main():
+    """ Import the JSON file of every model class
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+    if SQLITE is None:
+        parser.error("set MODELS_STORAGE=sqlite to migrate")
+
+    for cls in CLASSES:
+        if cls.import_from_file():
+            print("{}: {} objects in {}".format(
+                cls.__name__, cls.count(), SQLITE.file_path))
+        else:
+            print("{}: nothing to import".format(cls.__name__))
+
+
+if __name__ == '__main__':
+    main()
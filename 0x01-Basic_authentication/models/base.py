@@ -1,37 +1,195 @@
 #!/usr/bin/env python3
 """ Base module
 """
-from datetime import datetime
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from itertools import islice
 from typing import TypeVar, List, Iterable
-from os import path
+from os import getenv, path
+from models.json_stream import ObjectItems
+from models.sqlite_storage import SQLiteStorage
+from models.wal import WriteAheadLog, write_json_atomic
+import atexit
 import json
+import logging
+import signal
+import sys
+import threading
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# "json" keeps the objects in DATA and .db_<Class>.json files, "sqlite"
+# only in the SQLite file MODELS_SQLITE_FILE; the JSON files are not read
+# with "sqlite", move them over once with migrate_to_sqlite.py
+STORAGE = getenv("MODELS_STORAGE", "json")
+SQLITE = SQLiteStorage(getenv("MODELS_SQLITE_FILE", ".db.sqlite3"),
+                       TIMESTAMP_FORMAT) if STORAGE == "sqlite" else None
 DATA = {}
+INDEXES = {}
+SORTED_INDEXES = {}
+INDEXED_VALUES = {}
+# one reentrant lock per class around DATA and index updates and the
+# walks of the sorted indexes
+INDEX_LOCKS = {}
+# "snapshot" rewrites .db_<Class>.json on every change, "wal" appends
+# each change to .db_<Class>.log and compacts it in the background,
+# "write_behind" rewrites .db_<Class>.json from a background thread;
+# pending writes are flushed at exit and on SIGTERM, other shutdowns
+# must call flush() first
+PERSISTENCE = getenv("MODELS_PERSISTENCE", "snapshot")
+WAL_COMPACT_THRESHOLD = int(getenv("MODELS_WAL_COMPACT_THRESHOLD", 1000))
+WAL = {}
+FLUSH_INTERVAL = float(getenv("MODELS_FLUSH_INTERVAL", 1.0))
+FLUSH_BATCH = int(getenv("MODELS_FLUSH_BATCH", 100))
+DIRTY = {}
+# "eager" builds every object on load, "lazy" only remembers where each
+# object is in .db_<Class>.json and builds it on first access
+LOAD_MODE = getenv("MODELS_LOAD", "eager")
+LAZY = {}
+LAZY_FILES = {}
+_lazy_lock = threading.RLock()
+# MODELS_COMPACT=1 stores objects in __slots__ instead of a __dict__,
+# timestamps as integer microseconds since the epoch and interns the
+# values of __interned__ attributes
+COMPACT = getenv("MODELS_COMPACT", "0") == "1"
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+FIELDS = {}
+_save_locks = {}
+_dirty_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flush_now = threading.Event()
+_flusher = None
+_previous_sigterm = None
+
+
+def flush():
+    """ Write every class with unsaved changes to its file
+    A class whose write fails stays dirty for the next flush, the
+    first error is raised once the other classes are written
+    """
+    error = None
+    with _flush_lock:
+        with _dirty_lock:
+            dirty = list(DIRTY.values())
+            DIRTY.clear()
+        for cls, changes in dirty:
+            try:
+                cls.save_to_file()
+            except Exception as e:
+                with _dirty_lock:
+                    pending = DIRTY.get(cls.__name__, (cls, 0))[1]
+                    DIRTY[cls.__name__] = (cls, pending + changes)
+                error = error or e
+    if error is not None:
+        raise error
+
+
+def _flush_loop():
+    """ Flush every FLUSH_INTERVAL seconds, or sooner on a full batch
+    """
+    while True:
+        _flush_now.wait(FLUSH_INTERVAL)
+        _flush_now.clear()
+        try:
+            flush()
+        except Exception:
+            logging.getLogger(__name__).exception(
+                "write-behind flush failed, retrying")
+
+
+def _on_sigterm(signum: int, frame):
+    """ Flush, then hand SIGTERM to the previous handler
+    """
+    flush()
+    if callable(_previous_sigterm):
+        _previous_sigterm(signum, frame)
+    elif _previous_sigterm != signal.SIG_IGN:
+        # default action: exit, running the atexit handlers
+        sys.exit(128 + signum)
+
+
+if PERSISTENCE == "write_behind" and \
+        threading.current_thread() is threading.main_thread():
+    _previous_sigterm = signal.signal(signal.SIGTERM, _on_sigterm)
+
+
+def _mark_dirty(cls):
+    """ Record a change of cls for the background flusher
+    """
+    global _flusher
+    s_class = cls.__name__
+    with _dirty_lock:
+        changes = DIRTY.get(s_class, (cls, 0))[1] + 1
+        DIRTY[s_class] = (cls, changes)
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+    if changes >= FLUSH_BATCH:
+        _flush_now.set()
+
+
+def _timestamp(slot: str) -> property:
+    """ datetime attribute stored in slot as microseconds since the epoch
+    """
+    def getter(self) -> datetime:
+        return EPOCH + timedelta(microseconds=getattr(self, slot))
+
+    def setter(self, value: datetime):
+        setattr(self, slot, (value - EPOCH) // MICROSECOND)
+
+    return property(getter, setter)
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string
+    fromisoformat is much faster than strptime and parses the same
+    strings once their length and separators are checked
+    """
+    if len(value) == 19 and value[4::3] == "--T::":
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
 
 
 class Base():
     """ Base class
     """
 
+    # attributes with an equality index used by search()
+    __indexes__ = ()
+    # attributes kept in (value, id) order for the ranges of query()
+    __sorted_indexes__ = ('created_at', 'updated_at')
+    # attributes with values repeated across objects, interned in
+    # compact mode
+    __interned__ = ()
+
+    if COMPACT:
+        __slots__ = ('id', '_created_at', '_updated_at')
+        created_at = _timestamp('_created_at')
+        updated_at = _timestamp('_updated_at')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+            with self.__class__._index_lock():
+                if DATA.get(s_class) is None:
+                    DATA[s_class] = {}
+                    self.__class__._reset_indexes()
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = parse_timestamp(kwargs.get('created_at'))
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = parse_timestamp(kwargs.get('updated_at'))
         else:
             self.updated_at = datetime.utcnow()
 
@@ -44,11 +202,72 @@ class Base():
             return False
         return (self.id == other.id)
 
+    @classmethod
+    def _fields(cls) -> List[str]:
+        """ Attributes set by __init__, in to_json order
+        """
+        s_class = cls.__name__
+        if FIELDS.get(s_class) is None:
+            fields = ['id', 'created_at', 'updated_at']
+            if COMPACT:
+                for klass in reversed(cls.__mro__):
+                    if issubclass(klass, Base) and klass is not Base:
+                        fields.extend(klass.__dict__.get('__slots__', ()))
+            else:
+                fields.extend(key for key in cls().__dict__
+                              if key not in fields)
+            FIELDS[s_class] = fields
+        return FIELDS[s_class]
+
+    @classmethod
+    def _from_json(cls, obj_json: dict) -> TypeVar('Base'):
+        """ Build an object from its serialized form, as loaded from file
+        Skips __init__ and copies the fields directly: subclasses whose
+        __init__ does more than read its kwargs must override this
+        """
+        created_at = obj_json.get('created_at')
+        updated_at = obj_json.get('updated_at')
+        if obj_json.get('id') is None or created_at is None \
+                or updated_at is None:
+            return cls(**obj_json)
+        obj = cls.__new__(cls)
+        obj.id = obj_json['id']
+        obj.created_at = parse_timestamp(created_at)
+        obj.updated_at = parse_timestamp(updated_at)
+        for key in cls._fields()[3:]:
+            setattr(obj, key, obj_json.get(key))
+        obj._intern()
+        return obj
+
+    def _attributes(self) -> Iterable[tuple]:
+        """ (name, value) of every attribute set, in assignment order
+        """
+        if not COMPACT:
+            return self.__dict__.items()
+        attributes = []
+        for key in self.__class__._fields():
+            try:
+                attributes.append((key, getattr(self, key)))
+            except AttributeError:
+                continue
+        attributes.extend(getattr(self, '__dict__', {}).items())
+        return attributes
+
+    def _intern(self):
+        """ Intern the string values of __interned__ in compact mode
+        """
+        if not COMPACT:
+            return
+        for attr in self.__class__.__interned__:
+            value = getattr(self, attr, None)
+            if isinstance(value, str):
+                setattr(self, attr, sys.intern(value))
+
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
         """
         result = {}
-        for key, value in self.__dict__.items():
+        for key, value in self._attributes():
             if not for_serialization and key[0] == '_':
                 continue
             if isinstance(value, datetime):
@@ -57,20 +276,218 @@ class Base():
                 result[key] = value
         return result
 
+    @classmethod
+    def _index_lock(cls) -> threading.RLock:
+        """ Lock of the DATA entry and indexes of the class
+        """
+        lock = INDEX_LOCKS.get(cls.__name__)
+        if lock is None:
+            lock = INDEX_LOCKS.setdefault(cls.__name__, threading.RLock())
+        return lock
+
+    @classmethod
+    def _reset_indexes(cls):
+        """ Empty the indexes of the class
+        """
+        s_class = cls.__name__
+        with cls._index_lock():
+            INDEXES[s_class] = {attr: {} for attr in cls.__indexes__}
+            SORTED_INDEXES[s_class] = {attr: []
+                                       for attr in cls.__sorted_indexes__}
+            INDEXED_VALUES[s_class] = {}
+
+    @classmethod
+    def _sort_indexes(cls):
+        """ Sort the sorted indexes after a bulk load
+        """
+        with cls._index_lock():
+            for entries in SORTED_INDEXES[cls.__name__].values():
+                entries.sort()
+
+    @classmethod
+    def _unindex(cls, obj_id: str):
+        """ Remove an object from the indexes
+        """
+        with cls._index_lock():
+            s_class = cls.__name__
+            values = INDEXED_VALUES[s_class].pop(obj_id, None)
+            if values is None:
+                return
+            for attr, value in values.items():
+                if attr in cls.__sorted_indexes__:
+                    entries = SORTED_INDEXES[s_class][attr]
+                    i = bisect_left(entries, (value, obj_id))
+                    if i < len(entries) and entries[i] == (value, obj_id):
+                        del entries[i]
+                    continue
+                ids = INDEXES[s_class][attr].get(value)
+                ids.discard(obj_id)
+                if not ids:
+                    del INDEXES[s_class][attr][value]
+
+    @classmethod
+    def _index(cls, obj: TypeVar('Base'), bulk: bool = False):
+        """ (Re)index an object under its current attribute values
+        """
+        cls._index_values(obj.id, {attr: getattr(obj, attr, None)
+                                   for attr in cls.__indexes__ +
+                                   cls.__sorted_indexes__}, bulk)
+
+    @classmethod
+    def _index_values(cls, obj_id: str, values: dict, bulk: bool = False):
+        """ (Re)index an object ID under the given attribute values
+        With bulk (loading: obj_id is not indexed yet), sorted indexes
+        are only appended to and must be sorted with _sort_indexes()
+        """
+        with cls._index_lock():
+            s_class = cls.__name__
+            if not bulk:
+                cls._unindex(obj_id)
+            indexed = {}
+            for attr, value in values.items():
+                try:
+                    if attr not in cls.__sorted_indexes__:
+                        INDEXES[s_class][attr].setdefault(value,
+                                                          set()).add(obj_id)
+                    elif value is None:
+                        continue
+                    elif bulk:
+                        SORTED_INDEXES[s_class][attr].append((value, obj_id))
+                    else:
+                        insort(SORTED_INDEXES[s_class][attr], (value, obj_id))
+                except TypeError:
+                    continue
+                indexed[attr] = value
+            INDEXED_VALUES[s_class][obj_id] = indexed
+
+    @classmethod
+    def _materialize(cls, obj_id: str) -> TypeVar('Base'):
+        """ Return the object with this ID, building it if not loaded yet
+        """
+        s_class = cls.__name__
+        obj = DATA[s_class].get(obj_id)
+        if obj is not None:
+            return obj
+        with _lazy_lock:
+            entry = LAZY.get(s_class, {}).pop(obj_id, None)
+            if entry is None:
+                return DATA[s_class].get(obj_id)
+            f = LAZY_FILES[s_class]
+            f.seek(entry[0])
+            obj = cls._from_json(json.loads(f.read(entry[1])))
+            DATA[s_class][obj_id] = obj
+            return obj
+
+    @classmethod
+    def _materialize_all(cls):
+        """ Build every object not loaded yet
+        """
+        with _lazy_lock:
+            for obj_id in list(LAZY.get(cls.__name__, {})):
+                cls._materialize(obj_id)
+
+    @classmethod
+    def _load_lazy(cls, file_path: str) -> bool:
+        """ Index the objects of file_path without building them
+        Returns False, having loaded nothing, if the file cannot be
+        read incrementally
+        """
+        s_class = cls.__name__
+        f = open(file_path, 'rb')
+        try:
+            for obj_id, obj_json, offset, length in ObjectItems(f):
+                LAZY[s_class][obj_id] = (offset, length)
+                values = {attr: obj_json.get(attr)
+                          for attr in cls.__indexes__ +
+                          cls.__sorted_indexes__}
+                for attr in ('created_at', 'updated_at'):
+                    if values.get(attr) is not None:
+                        values[attr] = parse_timestamp(values[attr])
+                cls._index_values(obj_id, values, True)
+        except ValueError:
+            f.close()
+            LAZY[s_class] = {}
+            cls._reset_indexes()
+            return False
+        # the open file keeps the offsets valid after the file is replaced
+        LAZY_FILES[s_class] = f
+        return True
+
+    @classmethod
+    def _wal(cls) -> WriteAheadLog:
+        """ Write-ahead log of the class
+        """
+        s_class = cls.__name__
+        if WAL.get(s_class) is None:
+            WAL[s_class] = WriteAheadLog(".db_{}.json".format(s_class),
+                                         ".db_{}.log".format(s_class),
+                                         WAL_COMPACT_THRESHOLD)
+        return WAL[s_class]
+
+    @classmethod
+    def _snapshot(cls) -> dict:
+        """ All objects serialized, by ID
+        """
+        s_class = cls.__name__
+        objs_json = {}
+        with _lazy_lock:
+            f = LAZY_FILES.get(s_class)
+            for obj_id, (offset, length) in list(
+                    LAZY.get(s_class, {}).items()):
+                f.seek(offset)
+                objs_json[obj_id] = json.loads(f.read(length))
+        for obj_id, obj in list(DATA[s_class].items()):
+            objs_json[obj_id] = obj.to_json(True)
+        return objs_json
+
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
+        With SQLite storage, nothing is loaded (see import_from_file)
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
+        if SQLITE is not None:
             return
+        with cls._index_lock():
+            DATA[s_class] = {}
+            cls._reset_indexes()
+            with _lazy_lock:
+                LAZY[s_class] = {}
+                if LAZY_FILES.get(s_class) is not None:
+                    LAZY_FILES.pop(s_class).close()
+            loaded = not path.exists(file_path)
+            if not loaded and LOAD_MODE == "lazy":
+                loaded = cls._load_lazy(file_path)
+            if not loaded:
+                with open(file_path, 'r') as f:
+                    objs_json = json.load(f)
+                    for obj_id, obj_json in objs_json.items():
+                        DATA[s_class][obj_id] = cls._from_json(obj_json)
+                        cls._index(DATA[s_class][obj_id], True)
+            cls._sort_indexes()
+            if PERSISTENCE != "wal":
+                return
+            for record in cls._wal().replay():
+                obj_id = record.get('id')
+                LAZY[s_class].pop(obj_id, None)
+                if record.get('op') == 'remove':
+                    DATA[s_class].pop(obj_id, None)
+                    cls._unindex(obj_id)
+                else:
+                    DATA[s_class][obj_id] = cls._from_json(record.get('obj'))
+                    cls._index(DATA[s_class][obj_id])
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def import_from_file(cls) -> bool:
+        """ With SQLite storage, import .db_<Class>.json into the table
+        of the class, once: returns False if there is no file or it was
+        already imported
+        """
+        file_path = ".db_{}.json".format(cls.__name__)
+        if SQLITE is None or not path.exists(file_path):
+            return False
+        return SQLITE.import_json(cls, file_path)
 
     @classmethod
     def save_to_file(cls):
@@ -78,35 +495,67 @@ class Base():
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        if SQLITE is not None:
+            return
+        # one writer per class at a time, so the last snapshot taken is
+        # the one left in the file
+        with _save_locks.setdefault(s_class, threading.Lock()):
+            write_json_atomic(file_path, cls._snapshot())
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def _persist(cls, op: str, obj: TypeVar('Base')):
+        """ Persist one change (op is "save" or "remove") of obj
+        according to PERSISTENCE
+        """
+        if PERSISTENCE == "wal":
+            record = {'op': op, 'id': obj.id}
+            if op == 'save':
+                record['obj'] = obj.to_json(True)
+            cls._wal().append(record, cls._snapshot)
+        elif PERSISTENCE == "write_behind":
+            _mark_dirty(cls)
+        else:
+            cls.save_to_file()
 
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        if SQLITE is not None:
+            SQLITE.save(self)
+            return
+        self._intern()
+        with self.__class__._index_lock():
+            DATA[s_class][self.id] = self
+            LAZY.get(s_class, {}).pop(self.id, None)
+            self.__class__._index(self)
+        self.__class__._persist('save', self)
 
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        if SQLITE is not None:
+            SQLITE.remove(self)
+            return
+        with self.__class__._index_lock():
+            lazy = LAZY.get(s_class, {}).pop(self.id, None)
+            removed = DATA[s_class].pop(self.id, None) is not None or \
+                lazy is not None
+            if removed:
+                self.__class__._unindex(self.id)
+        if removed:
+            self.__class__._persist('remove', self)
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
         s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        if SQLITE is not None:
+            return SQLITE.count(cls)
+        return len(DATA[s_class].keys()) + len(LAZY.get(s_class, {}))
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -118,12 +567,40 @@ class Base():
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
+        if SQLITE is not None:
+            return SQLITE.get(cls, id)
+        return cls._materialize(id)
+
+    @classmethod
+    def _candidates(cls, attributes: dict) -> Iterable[TypeVar('Base')]:
+        """ Objects that may match, narrowed down by the indexes
+        """
         s_class = cls.__name__
-        return DATA[s_class].get(id)
+        ids = None
+        # copies taken under the lock: other threads save and remove
+        # meanwhile
+        with cls._index_lock():
+            for k, v in attributes.items():
+                if k not in cls.__indexes__:
+                    continue
+                try:
+                    matches = set(INDEXES[s_class][k].get(v, ()))
+                except TypeError:
+                    continue
+                ids = matches if ids is None else ids & matches
+        if ids is None:
+            cls._materialize_all()
+            with cls._index_lock():
+                return list(DATA[s_class].values())
+        objs = [cls._materialize(obj_id) for obj_id in ids]
+        # objects removed since the lookup are None
+        return [obj for obj in objs if obj is not None]
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+        Equality on indexed attributes (__indexes__) is answered from
+        the indexes, the other attributes are checked on the matches
         """
         s_class = cls.__name__
 
@@ -135,4 +612,74 @@ class Base():
                     return False
             return True
 
-        return list(filter(_search, DATA[s_class].values()))
+        if SQLITE is not None:
+            return list(filter(_search, SQLITE.select(cls, attributes)))
+        return list(filter(_search, cls._candidates(attributes)))
+
+    @classmethod
+    def query(cls, order_by: str = 'created_at', start=None, end=None,
+              attributes: dict = {}, descending: bool = False,
+              limit: int = None, offset: int = 0) -> List[TypeVar('Base')]:
+        """ Objects with matching attributes and start <= order_by < end,
+        ordered by order_by, skipping offset and returning at most limit
+        Objects without a value for order_by are left out. With a sorted
+        index on order_by (__sorted_indexes__) the range is found by
+        bisection and only the objects walked are built, otherwise the
+        matches of search() are filtered and sorted. With SQLite storage
+        the range, order, limit and offset are left to SQLite
+        """
+        s_class = cls.__name__
+
+        def _match(obj):
+            for k, v in attributes.items():
+                if (getattr(obj, k) != v):
+                    return False
+            return True
+
+        if SQLITE is not None:
+            if not attributes:
+                return list(SQLITE.select(cls, {}, order_by, start, end,
+                                          descending, limit, offset))
+            objs = filter(_match, SQLITE.select(cls, attributes, order_by,
+                                                start, end, descending))
+            stop = None if limit is None else offset + limit
+            return list(islice(objs, offset, stop))
+
+        if order_by not in cls.__sorted_indexes__:
+            objs = []
+            for obj in cls.search(attributes):
+                value = getattr(obj, order_by, None)
+                if value is None or (start is not None and value < start) \
+                        or (end is not None and value >= end):
+                    continue
+                objs.append(obj)
+            objs.sort(key=lambda obj: (getattr(obj, order_by), obj.id),
+                      reverse=descending)
+            stop = None if limit is None else offset + limit
+            return objs[offset:stop]
+
+        with cls._index_lock():
+            entries = SORTED_INDEXES[s_class][order_by]
+            # (value,) sorts before every (value, id) entry
+            lo = 0 if start is None else bisect_left(entries, (start,))
+            hi = len(entries) if end is None \
+                else bisect_left(entries, (end,))
+            positions = range(hi - 1, lo - 1, -1) if descending \
+                else range(lo, hi)
+            if not attributes:
+                stop = None if limit is None else offset + limit
+                objs = [cls._materialize(entries[i][1])
+                        for i in positions[offset:stop]]
+                return [obj for obj in objs if obj is not None]
+            result = []
+            for i in positions:
+                if limit is not None and len(result) >= limit:
+                    break
+                obj = cls._materialize(entries[i][1])
+                if obj is None or not _match(obj):
+                    continue
+                if offset > 0:
+                    offset -= 1
+                    continue
+                result.append(obj)
+            return result
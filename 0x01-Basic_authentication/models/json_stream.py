@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+""" Incremental reader of JSON object files
+"""
+from typing import BinaryIO, Iterator, Tuple
+import json
+import re
+
+
+WS = r'[ \t\n\r]*'
+WHITESPACE = re.compile(WS)
+OPEN = re.compile(WS + r'\{')
+# a key and its colon, or the closing brace of an empty object
+KEY = re.compile(WS + r'(?:(\})|"((?:[^"\\]|\\.)*)"' + WS + ':)')
+SEPARATOR = re.compile(WS + r'([,}])')
+
+
+class ObjectItems():
+    """ Iterate over the top-level items of a JSON object file
+    without holding the whole file in memory
+
+    Each item is yielded as (key, value, offset, length) where offset
+    and length locate the raw value in the file, so it can be read again
+    later. Files must be ASCII, as json.dump writes them by default.
+    """
+
+    def __init__(self, f: BinaryIO, chunk_size: int = 1 << 20):
+        """ Initialize an ObjectItems reader
+        """
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.base = 0
+        self.pos = 0
+
+    def _fill(self) -> bool:
+        """ Read one more chunk, dropping what was already consumed
+        """
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.base += self.pos
+        self.buf = self.buf[self.pos:] + chunk.decode('ascii')
+        self.pos = 0
+        return True
+
+    def _match(self, pattern: re.Pattern) -> re.Match:
+        """ Consume pattern, reading more of the file as needed
+        """
+        while True:
+            match = pattern.match(self.buf, self.pos)
+            if match is not None:
+                self.pos = match.end()
+                return match
+            if not self._fill():
+                raise ValueError("invalid JSON object at offset {}".format(
+                    self.base + self.pos))
+
+    def _value(self) -> Tuple[object, int, int]:
+        """ Decode the next value, returning it with its offset and length
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            start = self.pos
+            self.pos = end
+            return value, self.base + start, end - start
+
+    def __iter__(self) -> Iterator[Tuple[str, object, int, int]]:
+        """ Yield (key, value, offset, length) for every item
+        """
+        self._match(OPEN)
+        while True:
+            key = self._match(KEY)
+            if key.group(1) is not None:
+                return
+            key = key.group(2)
+            if '\\' in key:
+                key = json.loads('"{}"'.format(key))
+            value, offset, length = self._value()
+            yield key, value, offset, length
+            if self._match(SEPARATOR).group(1) == '}':
+                return
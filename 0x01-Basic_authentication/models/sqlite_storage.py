@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+""" SQLite storage module
+"""
+from datetime import datetime
+from typing import Iterator, List, Tuple
+import json
+import sqlite3
+import threading
+
+
+class SQLiteStorage():
+    """ Objects of Base subclasses stored in one SQLite file
+
+    Each class has a table holding the serialized object plus a column,
+    with an index, for id, created_at, updated_at and every attribute of
+    __indexes__ and __sorted_indexes__. Queries only read the rows they
+    return; attributes without a column are compared with json_extract.
+    """
+
+    def __init__(self, file_path: str, timestamp_format: str):
+        """ Initialize a SQLiteStorage
+        """
+        self.file_path = file_path
+        self.timestamp_format = timestamp_format
+        self._local = threading.local()
+        self._tables = set()
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Connection of the current thread, in autocommit mode
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.file_path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _columns(cls) -> List[str]:
+        """ Indexed columns of the table of cls
+        """
+        columns = ['id', 'created_at', 'updated_at']
+        for attr in cls.__indexes__ + cls.__sorted_indexes__:
+            if attr not in columns:
+                columns.append(attr)
+        return columns
+
+    def _table(self, cls) -> str:
+        """ Quoted name of the table of cls, created if needed
+        Columns of attributes added to __indexes__ or __sorted_indexes__
+        since the table was created are added and filled in from the
+        stored objects
+        """
+        table = '"{}"'.format(cls.__name__)
+        if cls.__name__ not in self._tables:
+            conn = self._connection()
+            columns = self._columns(cls)
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS {} (id TEXT PRIMARY KEY, {}, '
+                'object_json TEXT NOT NULL)'.format(
+                    table, ", ".join('"{}"'.format(column)
+                                     for column in columns[1:])))
+            existing = {row[1] for row in conn.execute(
+                'PRAGMA table_info({})'.format(table))}
+            for column in columns[1:]:
+                if column not in existing:
+                    conn.execute('ALTER TABLE {} ADD COLUMN "{}"'.format(
+                        table, column))
+                    conn.execute(
+                        'UPDATE {} SET "{}" = json_extract(object_json, ?)'
+                        .format(table, column), ('$."{}"'.format(column),))
+                conn.execute(
+                    'CREATE INDEX IF NOT EXISTS "{}_{}" ON {} ("{}")'.format(
+                        cls.__name__, column, table, column))
+            self._tables.add(cls.__name__)
+        return table
+
+    def _value(self, value):
+        """ SQLite value of an attribute value, None if it has none
+        """
+        if isinstance(value, datetime):
+            return value.strftime(self.timestamp_format)
+        if isinstance(value, (str, int, float)):
+            return value
+        return None
+
+    def _expression(self, cls, attr: str) -> Tuple[str, list]:
+        """ SQL expression of an attribute, with its parameters
+        """
+        if attr in self._columns(cls):
+            return '"{}"'.format(attr), []
+        return "json_extract(object_json, ?)", ['$."{}"'.format(attr)]
+
+    def save(self, obj):
+        """ Insert or replace obj
+        """
+        cls = obj.__class__
+        table = self._table(cls)
+        obj_json = obj.to_json(True)
+        columns = self._columns(cls)
+        self._connection().execute(
+            'INSERT OR REPLACE INTO {} ({}, object_json) VALUES ({})'.format(
+                table, ", ".join('"{}"'.format(column) for column in columns),
+                ", ".join("?" * (len(columns) + 1))),
+            [self._value(obj_json.get(column)) for column in columns] +
+            [json.dumps(obj_json)])
+
+    def remove(self, obj) -> bool:
+        """ Delete obj, returns False if it was not stored
+        """
+        table = self._table(obj.__class__)
+        cursor = self._connection().execute(
+            "DELETE FROM {} WHERE id = ?".format(table), (obj.id,))
+        return cursor.rowcount > 0
+
+    def import_json(self, cls, file_path: str) -> bool:
+        """ Insert the objects of a .db_<Class>.json file, so a store can
+        move from JSON files to SQLite
+        The import is recorded in the imports table, in the same
+        transaction: a file is imported at most once per class, and
+        False is returned if it already was
+        """
+        table = self._table(cls)
+        conn = self._connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS imports (class TEXT, "
+                     "file_path TEXT, PRIMARY KEY (class, file_path))")
+        with open(file_path, 'r') as f:
+            objs_json = json.load(f)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM imports WHERE class = ? AND "
+                            "file_path = ?", (cls.__name__, file_path)) \
+                    .fetchone():
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("INSERT INTO imports VALUES (?, ?)",
+                         (cls.__name__, file_path))
+            for obj_json in objs_json.values():
+                self.save(cls._from_json(obj_json))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return True
+
+    def count(self, cls) -> int:
+        """ Number of objects of cls
+        """
+        table = self._table(cls)
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM {}".format(table)).fetchone()[0]
+
+    def get(self, cls, obj_id: str):
+        """ Object of cls with this ID, or None
+        """
+        table = self._table(cls)
+        row = self._connection().execute(
+            "SELECT object_json FROM {} WHERE id = ?".format(table),
+            (obj_id,)).fetchone()
+        if row is None:
+            return None
+        return cls._from_json(json.loads(row[0]))
+
+    def select(self, cls, attributes: dict = {}, order_by: str = None,
+               start=None, end=None, descending: bool = False,
+               limit: int = None, offset: int = 0) -> Iterator:
+        """ Objects of cls, read one row at a time
+
+        Equality on attributes with a string, number or timestamp value
+        is checked by SQLite, the caller checks the other attributes.
+        With order_by, objects without a value for it are left out and
+        start <= order_by < end.
+        """
+        table = self._table(cls)
+        where, params = [], []
+        for attr, value in attributes.items():
+            if self._value(value) is None:
+                continue
+            expression, expression_params = self._expression(cls, attr)
+            where.append("{} = ?".format(expression))
+            params.extend(expression_params + [self._value(value)])
+        order = ""
+        if order_by is not None:
+            expression, expression_params = self._expression(cls, order_by)
+            where.append("{} IS NOT NULL".format(expression))
+            params.extend(expression_params)
+            for value, operator in ((start, ">="), (end, "<")):
+                if value is not None:
+                    where.append("{} {} ?".format(expression, operator))
+                    params.extend(expression_params + [self._value(value)])
+            direction = "DESC" if descending else "ASC"
+            order = " ORDER BY {0} {1}, id {1}".format(expression, direction)
+            params.extend(expression_params)
+        sql = "SELECT object_json FROM {}".format(table)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += order
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([-1 if limit is None else limit, offset])
+        for row in self._connection().execute(sql, params):
+            yield cls._from_json(json.loads(row[0]))
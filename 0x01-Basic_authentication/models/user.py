@@ -2,13 +2,19 @@
 """ User module
 """
 import hashlib
-from models.base import Base
+from models.base import Base, COMPACT
 
 
 class User(Base):
     """ User class
     """
 
+    __indexes__ = ('email',)
+    __interned__ = ('first_name', 'last_name')
+
+    if COMPACT:
+        __slots__ = ('email', '_password', 'first_name', 'last_name')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
@@ -17,6 +23,7 @@ class User(Base):
         self._password = kwargs.get('_password')
         self.first_name = kwargs.get('first_name')
         self.last_name = kwargs.get('last_name')
+        self._intern()
 
     @property
     def password(self) -> str:
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+""" Write-ahead log module
+"""
+from typing import Callable, Iterator
+from os import path
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+
+def write_json_atomic(file_path: str, obj: dict):
+    """ Write obj as JSON to file_path through a temporary file
+    so readers never see a partial file
+    Each call has its own temporary file, so concurrent writers do
+    not truncate each other's
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=path.dirname(path.abspath(file_path)),
+        prefix="{}.".format(path.basename(file_path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class WriteAheadLog():
+    """ Append-only log of mutations on top of a JSON snapshot
+
+    Every mutation is one JSON line. Once threshold lines are written
+    the log is rotated and a new snapshot is written by a background
+    thread; the rotated log is kept until that snapshot is in place.
+    """
+
+    def __init__(self, snapshot_path: str, log_path: str,
+                 threshold: int = 1000):
+        """ Initialize a WriteAheadLog
+        """
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.compacting_path = "{}.compacting".format(log_path)
+        self.threshold = threshold
+        self.records = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self._compactor = None
+
+    def replay(self) -> Iterator[dict]:
+        """ Yield the logged records, oldest first
+        Torn lines (crash during a write) are skipped
+        """
+        self.records = 0
+        for file_path in (self.compacting_path, self.log_path):
+            if not path.exists(file_path):
+                continue
+            with open(file_path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if file_path == self.log_path:
+                        self.records += 1
+                    yield record
+
+    def append(self, record: dict, snapshot: Callable[[], dict]):
+        """ Log one record, compacting with snapshot() past threshold
+        """
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.log_path, 'a')
+                if self._file.tell():
+                    # end a line possibly torn by a crash
+                    self._file.write("\n")
+            self._file.write(line)
+            self._file.flush()
+            self.records += 1
+            if self.records < self.threshold or self._compactor is not None:
+                return
+            self._rotate()
+            self.records = 0
+            self._compactor = threading.Thread(
+                target=self._compact, args=(snapshot,), daemon=True)
+            self._compactor.start()
+
+    def _rotate(self):
+        """ Move the current log aside, new records go to a new one
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if not path.exists(self.log_path):
+            return
+        if path.exists(self.compacting_path):
+            # a compaction that did not finish: keep its records too
+            with open(self.log_path, 'r') as src, \
+                    open(self.compacting_path, 'a') as dst:
+                dst.write("\n")
+                shutil.copyfileobj(src, dst)
+            os.remove(self.log_path)
+        else:
+            os.replace(self.log_path, self.compacting_path)
+
+    def _compact(self, snapshot: Callable[[], dict]):
+        """ Write a snapshot, then drop the rotated log it covers
+        """
+        try:
+            write_json_atomic(self.snapshot_path, snapshot())
+            os.remove(self.compacting_path)
+        finally:
+            self._compactor = None
+
+    def close(self):
+        """ Close the log file
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+In-memory login throttling with token buckets.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from os import getenv
+from typing import Hashable
+
+RATE_PER_MINUTE = float(getenv("LOGIN_RATE_PER_MINUTE", 10))
+BURST = int(getenv("LOGIN_BURST", 5))
+IDLE_SECONDS = float(getenv("LOGIN_THROTTLE_IDLE", 600))
+MAX_KEYS = int(getenv("LOGIN_THROTTLE_MAX_KEYS", 100000))
+MESSAGE = getenv("LOGIN_THROTTLE_MESSAGE", "too many login attempts")
+
+
+class LoginThrottle:
+    """
+    Token buckets keyed by client (IP address, email, ...).
+
+    Each bucket holds up to burst tokens refilled at rate_per_minute.
+    Buckets are kept in least recently used order, so idle ones and the
+    oldest ones past max_keys are evicted from the front in O(1).
+    """
+
+    def __init__(self, rate_per_minute: float = RATE_PER_MINUTE,
+                 burst: int = BURST, idle_seconds: float = IDLE_SECONDS,
+                 max_keys: int = MAX_KEYS):
+        """set the limits"""
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.idle_seconds = idle_seconds
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float) -> None:
+        """drop idle buckets and keep at most max_keys"""
+        buckets = self._buckets
+        while buckets:
+            updated = next(iter(buckets.values()))[1]
+            if len(buckets) <= self.max_keys and \
+                    now - updated < self.idle_seconds:
+                return
+            buckets.popitem(last=False)
+
+    def allow(self, *keys: Hashable) -> float:
+        """
+        Spend one token from the bucket of every key.
+
+        Returns 0 when all buckets had a token, otherwise nothing is
+        spent and the seconds until a retry can succeed are returned.
+        None keys are ignored.
+        """
+        keys = [key for key in keys if key is not None]
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key in keys:
+                tokens, updated = self._buckets.get(key, (self.burst, now))
+                levels.append(min(self.burst,
+                                  tokens + (now - updated) * self.rate))
+            wait = max([(1 - level) / self.rate
+                        for level in levels if level < 1] or [0])
+            for key, level in zip(keys, levels):
+                self._buckets[key] = (level if wait else level - 1, now)
+                self._buckets.move_to_end(key)
+            self._evict(now)
+        return wait
+
+
+def retry_after_header(wait: float) -> str:
+    """format a wait in seconds for the Retry-After header"""
+    return str(max(1, math.ceil(wait)))
@@ -4,10 +4,13 @@
 Authentication Views
 """
 from flask import request, jsonify, abort
+from api.v1.auth.throttle import MESSAGE, LoginThrottle, retry_after_header
 from api.v1.views import app_views
 from models.user import User
 from os import getenv
 
+throttle = LoginThrottle()
+
 
 @app_views.route('/auth_session/login', methods=['POST'], strict_slashes=False)
 def login() -> str:
@@ -17,6 +20,7 @@ def login() -> str:
     Returns:
       - Response containing a user JSON representation if login was successful
       - Response containing an error message if login failed
+      - 429 if the client or email made too many attempts
     """
     user_email = request.form.get('email')
     user_pwd = request.form.get('password')
@@ -24,6 +28,11 @@ def login() -> str:
         return jsonify(error="email missing"), 400
     if not user_pwd:
         return jsonify(error="password missing"), 400
+    wait = throttle.allow(('ip', request.remote_addr), ('email', user_email))
+    if wait:
+        response = jsonify(error=MESSAGE)
+        response.headers['Retry-After'] = retry_after_header(wait)
+        return response, 429
     try:
         user = User.search({"email": user_email})
     except Exception:
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+'''
+Admission control for the password hashing endpoints.
+'''
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+CPUS = os.cpu_count() or 1
+MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", CPUS))
+MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 4 * CPUS))
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 1.0))
+
+
+class Overloaded(Exception):
+    '''raised when a request is not admitted'''
+
+
+class AdmissionController:
+    '''
+    Let at most max_in_flight requests run at once.
+
+    Up to max_queue more wait at most queue_timeout seconds for a slot;
+    anything beyond that is refused at once with Overloaded.
+    '''
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT,
+                 max_queue: int = MAX_QUEUE,
+                 queue_timeout: float = QUEUE_TIMEOUT):
+        '''set the limits'''
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._queued = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    def _acquire(self) -> None:
+        '''take a slot, queueing for it if allowed'''
+        with self._cond:
+            if self._in_flight < self.max_in_flight and not self._queued:
+                self._in_flight += 1
+                self._admitted += 1
+                return
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise Overloaded('admission queue full')
+            self._queued += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self._in_flight >= self.max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timed_out += 1
+                        raise Overloaded('admission queue timeout')
+                    self._cond.wait(remaining)
+            finally:
+                self._queued -= 1
+            self._in_flight += 1
+            self._admitted += 1
+
+    def _release(self) -> None:
+        '''give a slot back and wake one waiter'''
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        '''run the with block in an admitted slot'''
+        self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        '''current and cumulative counters'''
+        with self._cond:
+            return {"in_flight": self._in_flight, "queued": self._queued,
+                    "admitted": self._admitted, "rejected": self._rejected,
+                    "timed_out": self._timed_out,
+                    "max_in_flight": self.max_in_flight,
+                    "max_queue": self.max_queue}
@@ -1,10 +1,28 @@
 #!/usr/bin/env python3
 '''A basic flask application'''
 from flask import Flask, jsonify, request, make_response, abort, redirect
+from admission import AdmissionController, Overloaded
 from auth import Auth
+from throttle import MESSAGE, LoginThrottle, retry_after_header
 
 app = Flask(__name__)
 AUTH = Auth()
+THROTTLE = LoginThrottle()
+ADMISSION = AdmissionController()
+
+
+@app.errorhandler(Overloaded)
+def overloaded(error) -> str:
+    '''shed load from the hashing endpoints with a fast 503'''
+    response = make_response(jsonify({"message": "service overloaded"}), 503)
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+@app.route('/admission', methods=['GET'])
+def admission_stats() -> str:
+    '''in-flight, queued and rejected counters of the hashing endpoints'''
+    return jsonify(ADMISSION.stats())
 
 
 @app.route('/', methods=['GET'])
@@ -22,7 +40,8 @@ def register_users() -> str:
         return jsonify({'message': 'missing email or password'}), 400
 
     try:
-        AUTH.register_user(email, password)
+        with ADMISSION.admit():
+            AUTH.register_user(email, password)
     except ValueError:
         return jsonify({'message': 'email already registered'}), 400
 
@@ -35,7 +54,16 @@ def login():
     email = request.form.get('email')
     password = request.form.get('password')
 
-    if AUTH.valid_login(email, password):
+    wait = THROTTLE.allow(('ip', request.remote_addr),
+                          email and ('email', email))
+    if wait:
+        response = make_response(jsonify({"message": MESSAGE}), 429)
+        response.headers['Retry-After'] = retry_after_header(wait)
+        return response
+
+    with ADMISSION.admit():
+        valid = AUTH.valid_login(email, password)
+    if valid:
         session_id = AUTH.create_session(email)
         if session_id:
             response = make_response(
@@ -107,7 +135,8 @@ def update_password() -> str:
         abort(400)
 
     try:
-        AUTH.update_password(reset_token, new_password)
+        with ADMISSION.admit():
+            AUTH.update_password(reset_token, new_password)
     except ValueError:
         abort(403)
 
@@ -2,13 +2,14 @@
 '''auth route that handles authentications'''
 import bcrypt
 from db import DB, User
+from hash_service import HashService, get_rounds, needs_rehash
 from sqlalchemy.orm.exc import NoResultFound
 import uuid
 
 
 def _hash_password(password: str) -> bytes:
     '''method hashes password using bycrypt'''
-    salted = bcrypt.gensalt()
+    salted = bcrypt.gensalt(get_rounds())
     hashed_password = bcrypt.hashpw(password.encode('utf-8'), salted)
     return hashed_password
 
@@ -30,9 +31,13 @@ class Auth:
     def __init__(self):
         '''instantiates the database'''
         self._db = DB()
+        self._hasher = HashService()
 
     def register_user(self, email: str, password: str) -> User:
-        '''register the user with the given email and password'''
+        '''
+        register the user with the given email and password,
+        hashing on the pool only once the email is known to be free
+        '''
         try:
             self._db.find_user_by(email=email)
             if User.email is not None:
@@ -40,7 +45,7 @@ class Auth:
         except NoResultFound:
             pass
 
-        hashed_password = _hash_password(password)
+        hashed_password = self._hasher.hash(password).result()
         user = self._db.add_user(email, hashed_password)
         return user
 
@@ -48,12 +53,19 @@ class Auth:
         '''
         Check if the provided email and password are valid for login.
         Returns True if valid, False otherwise.
+        A valid password whose hash has an outdated cost is rehashed
+        and stored.
         '''
         try:
             user = self._db.find_user_by(email=email)
         except NoResultFound:
             return False
-        if user and bcrypt.checkpw(password.encode(), user.hashed_password):
+        if user and self._hasher.check(password,
+                                       user.hashed_password).result():
+            if needs_rehash(user.hashed_password):
+                self._db.update_user(
+                    user.id,
+                    hashed_password=self._hasher.hash(password).result())
             return True
         else:
             return False
@@ -118,6 +130,6 @@ class Auth:
         except NoResultFound:
             raise ValueError
 
-        hashed_password = _hash_password(password)
+        hashed_password = self._hasher.hash(password).result()
         self._db.update_user(user.id, hashed_password=hashed_password,
                              reset_token=None)
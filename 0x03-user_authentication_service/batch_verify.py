@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+'''
+Batch bcrypt verification and rehashing.
+
+Reads JSON lines of {"id": ..., "hash": ..., "password": ...}, checks
+every pair on a process pool and writes one JSON line per input, in
+input order, as soon as its batch is done:
+{"id": ..., "valid": bool} plus "rehash" with a new hash when --rehash
+is given and a valid hash has an outdated cost.
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import IO, Iterator, List
+import bcrypt
+from hash_service import get_rounds
+
+BATCH_SIZE = 32
+
+
+def verify_batch(pairs: List[dict], rounds: int = None) -> List[dict]:
+    '''
+    Check each pair, rehashing valid ones made with less than rounds.
+    '''
+    results = []
+    for pair in pairs:
+        hashed = pair['hash'].encode('utf-8')
+        password = pair['password'].encode('utf-8')
+        try:
+            valid = bcrypt.checkpw(password, hashed)
+        except ValueError:
+            valid = False
+        result = {'id': pair.get('id'), 'valid': valid}
+        if valid and rounds and int(hashed.split(b'$')[2]) < rounds:
+            result['rehash'] = bcrypt.hashpw(
+                password, bcrypt.gensalt(rounds)).decode('utf-8')
+        results.append(result)
+    return results
+
+
+def read_batches(lines: IO[str], size: int) -> Iterator[List[dict]]:
+    '''group JSON lines into lists of size pairs'''
+    pairs = (json.loads(line) for line in lines if line.strip())
+    while True:
+        batch = list(islice(pairs, size))
+        if not batch:
+            return
+        yield batch
+
+
+def run(lines: IO[str], out: IO[str], workers: int = None,
+        rehash: bool = False, batch_size: int = BATCH_SIZE,
+        progress: IO[str] = sys.stderr, every: float = 5.0) -> int:
+    '''
+    Verify every pair read from lines, writing results to out.
+
+    Only a couple of batches per worker are in flight at once, so
+    memory stays flat however long the input is.
+    '''
+    workers = workers or os.cpu_count() or 1
+    rounds = get_rounds() if rehash else None
+    done = 0
+    start = last = time.perf_counter()
+
+    def write(results: List[dict]):
+        nonlocal done, last
+        out.write(''.join(json.dumps(r) + '\n' for r in results))
+        done += len(results)
+        now = time.perf_counter()
+        if progress is not None and now - last >= every:
+            last = now
+            progress.write(f'{done} checked, '
+                           f'{done / (now - start):.1f}/s\n')
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in read_batches(lines, batch_size):
+            if len(pending) >= 2 * workers:
+                write(pending.popleft().result())
+            pending.append(pool.submit(verify_batch, batch, rounds))
+        while pending:
+            write(pending.popleft().result())
+
+    if progress is not None:
+        elapsed = time.perf_counter() - start
+        progress.write(f'{done} checked in {elapsed:.1f}s, '
+                       f'{done / elapsed if elapsed else 0:.1f}/s\n')
+    return done
+
+
+def main():
+    '''command line entry point'''
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('input', nargs='?', default='-',
+                        help='JSON lines file, - for stdin')
+    parser.add_argument('-o', '--output', default='-')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--rehash', action='store_true')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    lines = sys.stdin if args.input == '-' else open(args.input)
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        run(lines, out, args.workers, args.rehash, args.batch_size)
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
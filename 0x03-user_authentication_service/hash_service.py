@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+'''
+bcrypt hashing on a bounded thread pool.
+'''
+import asyncio
+import math
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import bcrypt
+
+TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", 250))
+# the bcrypt.gensalt() default: calibration only ever raises the cost
+MIN_ROUNDS = 12
+MAX_ROUNDS = 31
+PROBE_ROUNDS = 8
+
+_rounds = None
+
+
+def calibrate_rounds(target_ms: float = TARGET_MS) -> int:
+    '''
+    Return the highest bcrypt cost that hashes within target_ms here.
+
+    A cheap cost is timed and extrapolated, every extra round doubling
+    the work; the result is kept between MIN_ROUNDS and MAX_ROUNDS.
+    '''
+    salt = bcrypt.gensalt(PROBE_ROUNDS)
+    elapsed = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        bcrypt.hashpw(b'calibration', salt)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    rounds = PROBE_ROUNDS + math.floor(math.log2(target_ms / 1000 / elapsed))
+    return max(MIN_ROUNDS, min(MAX_ROUNDS, rounds))
+
+
+def get_rounds() -> int:
+    '''BCRYPT_ROUNDS, or the cost calibrated once for this process'''
+    global _rounds
+    if _rounds is None:
+        rounds = os.getenv("BCRYPT_ROUNDS")
+        _rounds = int(rounds) if rounds else calibrate_rounds()
+    return _rounds
+
+
+def needs_rehash(hashed_password: bytes) -> bool:
+    '''whether a hash was made with less than the current cost'''
+    return int(hashed_password.split(b'$')[2]) < get_rounds()
+
+
+class HashService:
+    '''
+    Runs bcrypt hashing and verification on a pool of threads.
+
+    bcrypt releases the GIL, so up to max_workers hashes run on
+    separate cores at once while request threads only wait on them.
+    '''
+
+    def __init__(self, max_workers: int = None):
+        '''
+        create the pool, HASH_POOL_SIZE or one thread per core,
+        and settle the bcrypt cost for this process
+        '''
+        self.rounds = get_rounds()
+        if max_workers is None:
+            max_workers = int(os.getenv("HASH_POOL_SIZE",
+                                        os.cpu_count() or 1))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="bcrypt")
+
+    def hash(self, password: str) -> Future:
+        '''hash password with a fresh salt, returning a future'''
+        return self._executor.submit(
+            lambda: bcrypt.hashpw(password.encode('utf-8'),
+                                  bcrypt.gensalt(self.rounds)))
+
+    def check(self, password: str, hashed_password: bytes) -> Future:
+        '''check password against hashed_password, returning a future'''
+        return self._executor.submit(
+            bcrypt.checkpw, password.encode('utf-8'), hashed_password)
+
+    async def hash_async(self, password: str) -> bytes:
+        '''awaitable hash'''
+        return await asyncio.wrap_future(self.hash(password))
+
+    async def check_async(self, password: str,
+                          hashed_password: bytes) -> bool:
+        '''awaitable check'''
+        return await asyncio.wrap_future(
+            self.check(password, hashed_password))
+
+    def shutdown(self) -> None:
+        '''wait for pending hashes and stop the threads'''
+        self._executor.shutdown(wait=True)